@@ -75,7 +75,15 @@ app.layout = html.Div([
                 ),
             ], style={'margin': '20px', 'padding': '20px'}),
             
-            html.Div(id='tone-output', style={'margin': '20px', 'fontSize': '16px', 'textAlign': 'center'})
+            html.Div(id='tone-output', style={'margin': '20px', 'fontSize': '16px', 'textAlign': 'center'}),
+            
+            # Slider values are copied into these stores in the browser (clientside callbacks)
+            dcc.Store(id='freq-store', data=440),
+            dcc.Store(id='vol-store', data=30),
+            
+            # Samples the stores at ~12Hz while the tone plays, instead of a callback per drag event
+            dcc.Interval(id='param-tick', interval=80, n_intervals=0, disabled=True),
+            dcc.Store(id='applied-params')
             
         ], style={'textAlign': 'center', 'padding': '20px', 'backgroundColor': '#f9f9f9', 'borderRadius': '10px'}),
         
@@ -101,7 +109,8 @@ def play_beep(n_clicks):
 @app.callback(
     [Output('tone-button', 'children'),
      Output('tone-button', 'style'),
-     Output('tone-output', 'children')],
+     Output('tone-output', 'children'),
+     Output('param-tick', 'disabled')],
     Input('tone-button', 'n_clicks'),
     prevent_initial_call=True
 )
@@ -118,7 +127,7 @@ def toggle_tone(n_clicks):
             'border': 'none',
             'borderRadius': '5px'
         }
-        return 'Stop Tone', style, 'Tone is playing... adjust sliders to change sound'
+        return 'Stop Tone', style, 'Tone is playing... adjust sliders to change sound', False
     else:  # Even clicks = stop
         sound.stop_tone()
         style = {
@@ -131,25 +140,35 @@ def toggle_tone(n_clicks):
             'border': 'none',
             'borderRadius': '5px'
         }
-        return 'Start Tone', style, ''
+        return 'Start Tone', style, '', True
 
-# Callback for frequency changes
-@app.callback(
-    Output('freq-slider', 'value'),
+# Slider drags stay in the browser - just copy the value into its store
+app.clientside_callback(
+    "function(value) { return value; }",
+    Output('freq-store', 'data'),
     Input('freq-slider', 'value')
 )
-def update_frequency(freq):
-    sound.set_frequency(freq)
-    return freq
 
-# Callback for volume changes
-@app.callback(
-    Output('vol-slider', 'value'),
+app.clientside_callback(
+    "function(value) { return value; }",
+    Output('vol-store', 'data'),
     Input('vol-slider', 'value')
 )
-def update_volume(vol):
+
+# Callback for frequency/volume changes - throttled by the param-tick interval
+@app.callback(
+    Output('applied-params', 'data'),
+    Input('param-tick', 'n_intervals'),
+    State('freq-store', 'data'),
+    State('vol-store', 'data'),
+    State('applied-params', 'data')
+)
+def update_params(n, freq, vol, applied):
+    if applied == [freq, vol]:
+        return dash.no_update  # Sliders unchanged since last tick
+    sound.set_frequency(freq)
     sound.set_volume(vol / 100.0)  # Convert percentage to 0-1 range
-    return vol
+    return [freq, vol]
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8050, debug=True)
@@ -1,24 +1,45 @@
 import numpy as np
+import functools
 
 
 import numpy as np
 
 
+def _rate_column(alpha):
+    """Scalar alpha stays a float, a sequence becomes a column (one rate per average row)"""
+    alpha = np.asarray(alpha, dtype=np.float64)
+    if alpha.ndim == 0:
+        return float(alpha)
+    return alpha.reshape(-1, 1)
+
+
 class AdaptiveMovingAverage:
     def __init__(self, size, alpha_slow=0.01, alpha_fast=0.1):
         """
         Initialize adaptive exponential moving average
         
+        Passing sequences of alphas tracks several averages of the same signal
+        at once - average then has one row per alpha pair, and all rows are
+        updated together in a single vectorized pass.
+        
         Args:
             size: Number of data points in each sample
             alpha_slow: Learning rate when new value > current average (default 0.01)
             alpha_fast: Learning rate when new value < current average (default 0.1)
         """
         self.size = size
-        self.alpha_slow = alpha_slow
-        self.alpha_fast = alpha_fast
-        self.average = np.zeros(size)
+        self.alpha_slow = _rate_column(alpha_slow)
+        self.alpha_fast = _rate_column(alpha_fast)
+        
+        rows = np.broadcast(np.asarray(alpha_slow), np.asarray(alpha_fast)).shape
+        shape = rows + (size,)
+        self.average = np.zeros(shape)
         self.initialized = False
+        
+        # Scratch buffers reused by update() so the hot path never allocates
+        self._below = np.empty(shape, dtype=bool)
+        self._alpha = np.empty(shape)
+        self._delta = np.empty(shape)
     
     def update(self, new_values):
         """
@@ -28,47 +49,51 @@ class AdaptiveMovingAverage:
             new_values: numpy array or list of new values (must match size)
         
         Returns:
-            Updated average as numpy array
+            Updated average as numpy array (not a copy - do not modify,
+            use get_average() for a snapshot)
         """
         if len(new_values) != self.size:
             raise ValueError(f"Expected {self.size} values, got {len(new_values)}")
         
-        new_array = np.array(new_values)
+        new_array = np.asarray(new_values, dtype=np.float64)
         
         if not self.initialized:
             # First update - initialize with the first values
-            self.average = new_array.copy()
+            self.average[:] = new_array
             self.initialized = True
         else:
-            # Update each point with adaptive alpha
-            for i in range(self.size):
-                if new_array[i] < self.average[i]:
-                    # Signal below average - use fast alpha
-                    alpha = self.alpha_fast
-                else:
-                    # Signal above average - use slow alpha
-                    alpha = self.alpha_slow
-                
-                # Update exponential moving average
-                self.average[i] = alpha * new_array[i] + (1 - alpha) * self.average[i]
+            # Signal below average - use fast alpha, otherwise slow alpha
+            np.less(new_array, self.average, out=self._below)
+            np.copyto(self._alpha, self.alpha_slow)
+            np.copyto(self._alpha, self.alpha_fast, where=self._below)
+            
+            # Update exponential moving average in place:
+            # average += alpha * (new - average)
+            np.subtract(new_array, self.average, out=self._delta)
+            self._delta *= self._alpha
+            self.average += self._delta
         
-        return self.average.copy()
+        return self.average
     
     def get_average(self):
-        """Get current average without updating"""
+        """Get current average without updating (a copy, safe to keep or modify)"""
         return self.average.copy()
     
+    def view(self):
+        """Get current average without copying - read only, contents change on the next update()"""
+        return self.average
+    
     def reset(self):
         """Reset the average to zeros"""
         self.average.fill(0)
         self.initialized = False
     
     def set_alphas(self, alpha_slow=None, alpha_fast=None):
-        """Update alpha values"""
+        """Update alpha values (same number of rows as at construction)"""
         if alpha_slow is not None:
-            self.alpha_slow = alpha_slow
+            self.alpha_slow = _rate_column(alpha_slow)
         if alpha_fast is not None:
-            self.alpha_fast = alpha_fast
+            self.alpha_fast = _rate_column(alpha_fast)
             
             
             
@@ -76,40 +101,41 @@ class AdaptiveMovingAverage:
             
             
 
+@functools.lru_cache(maxsize=8)
+def _rfft_frequencies(n, sample_interval_us):
+    """Positive FFT bin frequencies for n samples (cached, read-only)"""
+    frequencies = np.fft.rfftfreq(n, d=sample_interval_us * 1e-6)
+    frequencies.setflags(write=False)
+    return frequencies
+
 def compute_fft(samples, sample_interval_us=3):
     """
     Compute FFT of signal samples
     
+    Uses the real-input FFT, which only computes the non-negative frequencies.
+    
     Args:
         samples: array-like of signal values
         sample_interval_us: time between samples in microseconds
         
     Returns:
-        dict with frequencies and magnitudes (as Python lists)
+        dict with frequencies and magnitudes (as numpy arrays - call .tolist()
+        at the JSON boundary if needed; frequencies is shared, do not modify)
     """
     n = len(samples)
     
-    # Calculate sample rate from interval
-    sample_rate = 1e6 / sample_interval_us  # Convert µs to Hz
-    
-    # Compute FFT
-    fft_result = np.fft.fft(samples)
+    # Compute FFT (positive frequencies only)
+    fft_result = np.fft.rfft(samples)
     
     # Get magnitude
     magnitudes = np.abs(fft_result)
     
-    # Get frequencies
-    frequencies = np.fft.fftfreq(n, d=1/sample_rate)
+    # Get frequencies (fixed for a given n and sample interval)
+    frequencies = _rfft_frequencies(n, sample_interval_us)
     
-    # Keep only positive frequencies (first half)
-    positive_idx = frequencies >= 0
-    frequencies = frequencies[positive_idx]
-    magnitudes = magnitudes[positive_idx]
-    
-    # Convert to Python lists for JSON serialization
     return {
-        'frequencies': frequencies.tolist(),
-        'magnitudes': magnitudes.tolist()
+        'frequencies': frequencies,
+        'magnitudes': magnitudes
     }
     
  
@@ -127,59 +153,61 @@ def normalize_samples(samples, first=0, last=None):
               Use negative indices to count from end (e.g., -1 = exclude last)
         
     Returns:
-        list containing only the extracted subset, normalized to 0-1
+        numpy array containing only the extracted subset, normalized to 0-1
     
     Example:
         samples = [100, 200, 500, 1000, 800, 600, 50]  # 7 samples
         normalize_samples(samples, first=1, last=-1)
         # Extracts samples[1:-1] = [200, 500, 1000, 800, 600]
         # Min=200, Max=1000, Range=800
-        # Returns [0.0, 0.375, 1.0, 0.75, 0.5]  (5 samples)
+        # Returns array([0.0, 0.375, 1.0, 0.75, 0.5])  (5 samples)
     """
     if last is None:
         last = len(samples)
     
     # Extract the subset
-    subset = samples[first:last]
+    subset = np.asarray(samples[first:last], dtype=np.float64)
     
-    if len(subset) == 0:
-        return []
+    if subset.size == 0:
+        return subset
     
     # Find min and max
-    min_val = min(subset)
-    max_val = max(subset)
+    min_val = subset.min()
+    max_val = subset.max()
     val_range = max_val - min_val
     
     # Normalize the subset
     if val_range > 0:
-        normalized = [(s - min_val) / val_range for s in subset]
+        normalized = (subset - min_val) / val_range
     else:
         # All values are the same
-        normalized = [0.5] * len(subset)
+        normalized = np.full_like(subset, 0.5)
     
     return normalized
     
     
     
-# Global features dict accessible to all modules
-current_features = {
-    'total_sum': 0,
-    'first_half_sum': 0,
-    'second_half_sum': 0,
-    'diff': 0,
-    'cumulative_total': 0,
-    'peak': 0,
-    'timestamp': 0,
-    'ratio': 0
-}
+class Features:
+    """Signal features shared between modules (slotted attributes instead of string-keyed dict lookups)"""
+    __slots__ = ('total_sum', 'first_half_sum', 'second_half_sum', 'diff',
+                 'cumulative_total', 'peak', 'timestamp', 'ratio',
+                 'med_av_diff', 'med_av_first_half', 'med_av_second_half', 'med_av_ratio')
+    
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+
+# Global features accessible to all modules
+current_features = Features()
     
 def extract_signal_features(samples, start_index=4, end_trim=0):
     """
     Extract shape and strength features from a sample set.
-    Updates the global current_features dict directly.
+    Updates the global current_features object directly.
     
     Args:
-        samples: list of sample values (typically 25 samples)
+        samples: numpy array (or list) of sample values (typically 25 samples)
         start_index: first index to include (default 6 = skip first 6)
         end_trim: number of samples to trim from end (default 1)
         
@@ -188,6 +216,10 @@ def extract_signal_features(samples, start_index=4, end_trim=0):
         - first_half_sum: sum of first half of subset
         - second_half_sum: sum of second half of subset
         - diff: first_half_sum - second_half_sum
+        - ratio: first_half_sum / second_half_sum (1.0 if second_half_sum is 0)
+    
+    Values are stored as Python floats so the per-curve scalar math downstream
+    (peak tracker, soundscape, websocket) does not go through numpy scalars.
         
     Example:
         samples = [10, 20, 30, 40, 50, 60, 70, 80, 90, 100]
@@ -200,50 +232,57 @@ def extract_signal_features(samples, start_index=4, end_trim=0):
     """
     global current_features
     
-    # Extract subset
+    samples = np.asarray(samples)
+    
+    # Extract subset (a view, no copy)
     if end_trim > 0:
         subset = samples[start_index:-end_trim]
     else:
         subset = samples[start_index:]
     
     if len(subset) == 0:
-        current_features.update({
-            'total_sum': 0,
-            'first_half_sum': 0,
-            'second_half_sum': 0,
-            'diff': 0
-        })
+        current_features.total_sum = 0
+        current_features.first_half_sum = 0
+        current_features.second_half_sum = 0
+        current_features.diff = 0
+        current_features.ratio = 1.0
         return
     
     # Calculate total sum
-    total_sum = sum(subset)
-    
-    # Split into halves
-    mid_point = len(subset) // 2
-    first_half = subset[:10]
-    second_half = subset[-6:]
+    total_sum = subset.sum().item()
     
-    # Calculate half sums
-    first_half_sum = sum(first_half) / 10
-    second_half_sum = sum(second_half) / 6
+    # Split into halves (views) and average each
+    first_half_sum = subset[:10].sum().item() / 10
+    second_half_sum = subset[-6:].sum().item() / 6
     diff1 = first_half_sum - second_half_sum
     
-    # Update global features dict directly
-    current_features.update({
-        'total_sum': total_sum,
-        'first_half_sum': first_half_sum,
-        'second_half_sum': second_half_sum,
-        'diff': diff1
-    })
+    # Update global features directly
+    current_features.total_sum = total_sum
+    current_features.first_half_sum = first_half_sum
+    current_features.second_half_sum = second_half_sum
+    current_features.diff = diff1
+    current_features.ratio = first_half_sum / second_half_sum if second_half_sum else 1.0
     
 
+# Precomputed '00'-'99' strings for force_two_digit
+_TWO_DIGIT = [f"{i:02d}" for i in range(100)]
+
 def force_two_digit(value):
     """Force any value to 2-digit string '00'-'99'."""
+    if isinstance(value, (int, float)):
+        # Fast path for numbers: clamp to 0-99 and look up (NaN falls through)
+        if 0 <= value < 99:
+            return _TWO_DIGIT[int(value)]
+        if value >= 99:
+            return _TWO_DIGIT[99]
+        if value < 0:
+            return _TWO_DIGIT[0]
+    
     try:
         # Convert to int, clamp to 0-99, pad with zero
         num = int(float(value))
         num = max(0, min(99, num))
-        return f"{num:02d}"  # Same as str(num).zfill(2)
+        return _TWO_DIGIT[num]
     except (ValueError, TypeError):
         return "00"  # Default on error
         
@@ -252,20 +291,20 @@ def force_two_digit(value):
 def update_peak_tracker():
     """Updates cumulative_total and peak directly in current_features."""
     global current_features
-    current = current_features['med_av_diff'] 
+    current = current_features.med_av_diff 
     
     play_conductivity = False
     getratio = 0;
     
     # Reset condition: diff fell below zero
     if current < 0:
-        if(current_features['peak'] > 10):
+        if(current_features.peak > 10):
             play_conductivity = True
-            getratio = current_features['med_av_ratio'] 
+            getratio = current_features.med_av_ratio 
             getratio *= 100
             
-        current_features['cumulative_total'] = 0
-        current_features['peak'] = max(current, 0)  # or just 0
+        current_features.cumulative_total = 0
+        current_features.peak = max(current, 0)  # or just 0
         
         if(play_conductivity):                    
             num = force_two_digit(getratio)           
@@ -273,16 +312,16 @@ def update_peak_tracker():
             
     
     # Positive diff - accumulate
-    current_features['cumulative_total'] += current
+    current_features.cumulative_total += current
     
     # Update peak if we have a new maximum
-    if current > current_features['peak']:
-        current_features['peak'] = current
+    if current > current_features.peak:
+        current_features.peak = current
         
         # update the condutctivity ratio        
-        if current_features['med_av_first_half'] != 0:
-            current_features['med_av_ratio'] = current_features['med_av_second_half'] / current_features['med_av_first_half']
+        if current_features.med_av_first_half != 0:
+            current_features.med_av_ratio = current_features.med_av_second_half / current_features.med_av_first_half
         else:
-            current_features['med_av_ratio'] = 0
+            current_features.med_av_ratio = 0
     
     return False  # No reset/trigger
@@ -2,7 +2,9 @@ import serial
 import numpy as np
 import threading
 import time
-from collections import deque
+import functools
+import os
+import selectors
 from functions import AdaptiveMovingAverage
 import functions
 import sound  
@@ -19,21 +21,58 @@ baud_rate = 1000000
 is_reading = False
 read_thread = None
 
+# Serial framing
+frame_format = 'csv'  # 'csv' = one comma separated text line per curve, 'binary' = sync word + uint16 samples
+FRAME_SYNC = b'\xaa\x55'
+FRAME_SIZE = len(FRAME_SYNC) + CURVE_SAMPLE_SIZE * 2  # 52 bytes per curve in binary mode
+FRAME_WORDS = FRAME_SIZE // 2  # Frame length in uint16s
+_SYNC_WORD = int.from_bytes(FRAME_SYNC, 'little')  # Sync bytes read as a little-endian uint16
+RX_BUFFER_LIMIT = 4096  # Drop buffered bytes past this size if no frame boundary is found
+READ_CHUNK_SIZE = 4096  # Max bytes taken from the port per read
+READ_WAIT_S = 0.5  # Max time to wait for data before re-checking is_reading
+_rx_buffer = bytearray()  # Bytes received but not yet parsed into a curve
+
 # Data storage
-data_buffer = deque(maxlen=TIME_BUFFER_SIZE)  # Store last 100 discharge curves (10 seconds at 10Hz)
-latest_curve = None
+# Ring buffer of the last 100 discharge curves - one row per curve, preallocated so storing never allocates
+# (float32 holds the ADC sample values exactly at half the size of float64)
+_ring = np.empty((TIME_BUFFER_SIZE, CURVE_SAMPLE_SIZE), dtype=np.float32)
+_ts = np.empty(TIME_BUFFER_SIZE)  # Timestamp of each row in _ring
+_idx = 0  # Next row to write
+_count = 0  # Number of valid rows
 sample_interval_us = 3  # microseconds between samples
 running_sum = np.zeros(CURVE_SAMPLE_SIZE)  # Sum of last 100 curves for each point
 
-# adaptive moving average
-long_average_curve = AdaptiveMovingAverage(CURVE_SAMPLE_SIZE, alpha_slow=0.03, alpha_fast=0.1)
-fast_average_curve = AdaptiveMovingAverage(CURVE_SAMPLE_SIZE, alpha_slow=0.3, alpha_fast=0.3)
+# Sample times are the same for every curve - build once and share the (read-only) array
+_TIMES_US = np.arange(CURVE_SAMPLE_SIZE, dtype=np.uint32) * sample_interval_us
+_TIMES_US.setflags(write=False)
+
+# adaptive moving averages of the curve, updated together in one pass:
+# row LONG_AVERAGE = long baseline, row FAST_AVERAGE = fast signal
+LONG_AVERAGE = 0
+FAST_AVERAGE = 1
+curve_averages = AdaptiveMovingAverage(CURVE_SAMPLE_SIZE, alpha_slow=(0.03, 0.3), alpha_fast=(0.1, 0.3))
 
 medium_average_curve =  AdaptiveMovingAverage(3, alpha_slow=0.1, alpha_fast=0.1)
 
+# Scratch buffers for the per-curve sound pipeline
+_normalized = np.empty(CURVE_SAMPLE_SIZE)  # fast average - long average
+_medium_input = np.empty(3)  # diff, first_half_sum, second_half_sum fed to the medium average
+
 # Sound control
 enable_sound = True  # Flag to enable/disable sound updates
 
+# Called (from the reader thread) after each batch of new curves is stored
+_frame_listeners = []
+
+def add_frame_listener(callback):
+    """Register callback() to be called from the reader thread whenever new curves are stored"""
+    _frame_listeners.append(callback)
+
+def remove_frame_listener(callback):
+    """Unregister a callback added with add_frame_listener"""
+    if callback in _frame_listeners:
+        _frame_listeners.remove(callback)
+
 def set_sound_enabled(enabled):
     """Enable or disable real-time sound updates"""
     global enable_sound
@@ -46,11 +85,18 @@ def set_sound_enabled(enabled):
             pass
     print(f"Sound updates {'enabled' if enabled else 'disabled'}")
 
+@functools.lru_cache(maxsize=8)
+def _compensation_factors(tau, interval_us, size):
+    """Compute (and cache) read-only compensation factors for one tau/interval/size combination"""
+    factors = np.exp(np.arange(size) * interval_us / tau)
+    factors.setflags(write=False)
+    return factors
+
 def get_compensation_factors():
-    """Calculate compensation factors based on current tau setting"""
+    """Get compensation factors for the current tau setting (read-only array, do not modify)"""
     import settings
     tau = settings.settings.tau
-    return np.exp(np.arange(CURVE_SAMPLE_SIZE) * sample_interval_us / tau)
+    return _compensation_factors(tau, sample_interval_us, CURVE_SAMPLE_SIZE)
 
 def init(device=None, baud=230400):
     """
@@ -112,133 +158,282 @@ def stop_reading():
         read_thread.join(timeout=2)
     print("Serial reading stopped")
 
+def _process_curves(curves):
+    """
+    Run a batch of parsed discharge curves (one per row) through the averaging,
+    sound and storage pipeline
+    """
+    # NOT USING
+    #   compensated = curves * get_compensation_factors()
+    compensated = curves
+    
+    strength = None
+    for values_array in compensated:
+        # Update the adaptive moving averages (long and fast) - sequential, each curve builds on the last
+        curve_averages.update(values_array)
+        
+        # === REAL-TIME SOUND UPDATES ===
+        if enable_sound:
+            try:
+                # Features and peak tracking see every curve
+                strength, ratio = _update_sound_features()
+            except Exception as e:
+                print(f"Sound update error: {e}")
+    
+    # Update sound once per batch - intermediate settings within a batch would never be heard
+    if strength is not None:
+        try:
+            sound.soundscape(strength, ratio)
+        except Exception as e:
+            print(f"Sound update error: {e}")
+    
+    # Valid discharge curves - store compensated values in the ring buffer
+    _store_curves(compensated)
+    
+    # Tell listeners (e.g. the websocket server) there is new data
+    for callback in list(_frame_listeners):
+        try:
+            callback()
+        except Exception as e:
+            print(f"Frame listener error: {e}")
+
+def _store_curves(curves):
+    """Write a batch of curves (one per row) into the ring buffer in one indexed assignment (single curves directly)"""
+    global _idx, _count
+    
+    count = len(curves)
+    if count > TIME_BUFFER_SIZE:
+        # Only the newest TIME_BUFFER_SIZE curves survive anyway
+        skip = count - TIME_BUFFER_SIZE
+        _idx = (_idx + skip) % TIME_BUFFER_SIZE
+        curves = curves[skip:]
+        count = TIME_BUFFER_SIZE
+    
+    if count == 1:
+        # Usual case - a plain row write is much cheaper than the indexed batch path
+        _ring[_idx] = curves[0]
+        _ts[_idx] = time.time()
+        _idx = (_idx + 1) % TIME_BUFFER_SIZE
+        _count = min(_count + 1, TIME_BUFFER_SIZE)
+        return
+    
+    rows = (_idx + np.arange(count)) % TIME_BUFFER_SIZE
+    _ring[rows] = curves
+    _ts[rows] = time.time()
+    _idx = (_idx + count) % TIME_BUFFER_SIZE
+    _count = min(_count + count, TIME_BUFFER_SIZE)
+
+def _update_sound_features():
+    """
+    Derive the sound parameters from the current moving averages in one pass,
+    writing into preallocated buffers instead of creating intermediate arrays
+    
+    Updates functions.current_features, the medium average and the peak tracker
+    (which may trigger a conductivity readout).
+    
+    Returns:
+        (signal_strength, signal_shape_ratio) for sound.soundscape
+    """
+    features = functions.current_features
+    
+    # Calculate normalized signal (fast signal - long baseline)
+    averages = curve_averages.view()
+    np.subtract(averages[FAST_AVERAGE], averages[LONG_AVERAGE], out=_normalized)
+    
+    # Extract signal features for sound (and update global data)
+    functions.extract_signal_features(_normalized)
+    
+    # monitor signal peaks of a slower moving average
+    #
+    # keep a slower average of the signal, used for the conductivity calculation and voice
+    _medium_input[0] = features.diff
+    _medium_input[1] = features.first_half_sum
+    _medium_input[2] = features.second_half_sum
+    medium_average_curve.update(_medium_input)
+    
+    # One conversion to Python floats for the scalar peak-tracker math
+    features.med_av_diff, features.med_av_first_half, features.med_av_second_half = medium_average_curve.view().tolist()
+    
+    peakresult = functions.update_peak_tracker()
+    
+    # Play conductivity number if detected
+    if peakresult and peakresult[0] == 'play':
+        number_to_say = peakresult[1]  # e.g., '32'
+        print(" RATIO  ", peakresult)
+        wav_player.say(number_to_say)
+    
+    features.timestamp = time.time()
+    
+    # ratio not used by soundscape
+    return features.diff, 1
+
+def _next_csv_curves():
+    """
+    Pop every complete text line from the receive buffer and parse them as one batch
+    
+    Returns:
+        2D numpy array of parsed values (one row per valid line),
+        None if none of the lines were valid, or False when no complete line is buffered yet
+    """
+    end = _rx_buffer.rfind(b'\n')
+    if end < 0:
+        if len(_rx_buffer) > RX_BUFFER_LIMIT:
+            # No line ending in sight - drop the junk
+            _rx_buffer.clear()
+        return False
+    
+    lines = _rx_buffer[:end].decode('utf-8', errors='ignore').split('\n')
+    del _rx_buffer[:end + 1]
+    
+    curves = np.empty((len(lines), CURVE_SAMPLE_SIZE))
+    count = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        
+        # Parse CSV values - expecting CURVE_SAMPLE_SIZE values per discharge curve
+        try:
+            # Parse the comma separated floats in C (handles a trailing comma)
+            values_array = np.fromstring(line, sep=',', dtype=np.float64)
+        except ValueError as e:
+            # Failed to parse numbers
+            print(f"Parse error: {e}")
+            continue
+        
+        if values_array.size != CURVE_SAMPLE_SIZE:
+            # Wrong number of values - log warning
+            print(f"Warning: Expected {CURVE_SAMPLE_SIZE} values, got {values_array.size}")
+            continue
+        
+        curves[count] = values_array
+        count += 1
+    
+    if count == 0:
+        return None
+    return curves[:count]
+
+def _next_binary_curves():
+    """
+    Pop all consecutive complete binary frames (sync word + little-endian uint16 samples)
+    from the front of the receive buffer and decode them together
+    
+    Returns:
+        2D numpy array of sample values (one row per frame),
+        or False when no complete frame is buffered yet
+    """
+    start = _rx_buffer.find(FRAME_SYNC)
+    if start < 0:
+        # Keep the last byte - it may be the first half of a sync word
+        del _rx_buffer[:-1]
+        return False
+    
+    if start > 0:
+        # Resync - discard bytes before the sync word
+        del _rx_buffer[:start]
+    
+    frame_count = len(_rx_buffer) // FRAME_SIZE
+    if frame_count == 0:
+        return False
+    
+    # Each frame is FRAME_WORDS uint16s - the sync word followed by the samples
+    frames = np.frombuffer(bytes(_rx_buffer[:frame_count * FRAME_SIZE]), dtype='<u2')
+    frames = frames.reshape(frame_count, FRAME_WORDS)
+    
+    # Take frames up to the first one that is out of sync (the first frame always is in sync)
+    in_sync = frames[:, 0] == _SYNC_WORD
+    if not in_sync.all():
+        frame_count = int(np.argmin(in_sync))
+        frames = frames[:frame_count]
+    
+    del _rx_buffer[:frame_count * FRAME_SIZE]
+    return frames[:, 1:].astype(np.float64)
+
 def _read_loop():
     """Background thread that continuously reads serial data"""
-    global latest_curve, running_sum, long_average_curve, fast_average_curve, medium_average_curve
     
-    while is_reading:
-        try:
-            if serial_port and serial_port.in_waiting > 0:
-                # Read a line from serial
-                line = serial_port.readline().decode('utf-8', errors='ignore').strip()
+    # Wait for the port in epoll (via selectors) and drain it straight from the
+    # file descriptor - one wakeup and one read() syscall per burst of data
+    fd = serial_port.fileno()
+    selector = selectors.DefaultSelector()
+    selector.register(fd, selectors.EVENT_READ)
+    
+    try:
+        while is_reading:
+            try:
+                if not selector.select(timeout=READ_WAIT_S):
+                    continue  # Nothing arrived - just re-check is_reading
                 
-                if line:
-                    # Parse CSV values - expecting CURVE_SAMPLE_SIZE values per discharge curve
-                    try:
-                        # Split and convert to floats, filtering empty strings
-                        values = [float(x) for x in line.split(',') if x.strip()]
-                        
-                        if len(values) == CURVE_SAMPLE_SIZE:
-                            values_array = np.array(values)
-                            
-                            # NOT USING
-                            #   compensated = values_array * get_compensation_factors()
-                            compensated = values_array
-                            
-                            # Update the adaptive moving averages
-                            long_average_curve.update(compensated)
-                            fast_average_curve.update(compensated)
-                         
-                            
-                            # === REAL-TIME SOUND UPDATES ===
-                            if enable_sound:
-                                try:
-                                    # Calculate normalized signal (fast signal - long baseline)
-                                    fast_signal = fast_average_curve.get_average()
-                                    
-                                    long_baseline = long_average_curve.get_average()
-                                    
-                                    normalized = fast_signal - long_baseline                                     
-                                    
-                                    # Extract signal features for sound (and update global data)
-                                    
-                                    functions.extract_signal_features(normalized.tolist())
-                                    
-                                    # monitor signal peaks of a slower moving average
-                                    #
-                                    # keep a slower average of the signal, used for the conductivity calculation and voice
-                                    
-                                    # this can be put in a separate function TODO
-                                                                       
-                                    
-                                    medium_average_curve.update([functions.current_features['diff'], functions.current_features['first_half_sum'], functions.current_features['second_half_sum']])  
-                                    
-                                    med_averages =  medium_average_curve.get_average()
-                                    
-                                    functions.current_features['med_av_diff'] = med_averages[0]
-                                    functions.current_features['med_av_first_half'] = med_averages[1]   
-                                    functions.current_features['med_av_second_half'] = med_averages[2]                                    
-                                    
-                                    peakresult = functions.update_peak_tracker()
-                                    
-                                    # Play conductivity number if detected
-                                    if peakresult and peakresult[0] == 'play':
-                                        number_to_say = peakresult[1]  # e.g., '32'
-                                        print(" RATIO  ", peakresult)
-                                        wav_player.say(number_to_say)
-                                    
-                                                                        
-                                    
-                                    functions.current_features['timestamp'] = time.time()
-                                    
-                                    # not used
-                                    ratio = 1;
-                                  
-                                    
-                                    # Update sound at real data rate (~20Hz)
-                                    sound.soundscape(functions.current_features['diff'], ratio)
-                                    
-                                except Exception as e:
-                                    print(f"Sound update error: {e}")
-                            
-                            # Valid discharge curve - store compensated values
-                            curve_data = {
-                                'timestamp': time.time(),
-                                'values': compensated.tolist(),
-                                'times_us': [i * sample_interval_us for i in range(CURVE_SAMPLE_SIZE)]
-                            }
-                            
-                            data_buffer.append(curve_data)
-                            latest_curve = curve_data
-                        else:
-                            # Wrong number of values - log warning
-                            print(f"Warning: Expected {CURVE_SAMPLE_SIZE} values, got {len(values)}")
-                        
-                    except ValueError as e:
-                        # Failed to parse numbers
-                        print(f"Parse error: {e}")
+                try:
+                    chunk = os.read(fd, READ_CHUNK_SIZE)
+                except BlockingIOError:
+                    continue  # Spurious wakeup
+                
+                if not chunk:
+                    raise serial.SerialException('device reports readiness to read but returned no data '
+                                                 '(device disconnected?)')
+                
+                _rx_buffer.extend(chunk)
+                
+                next_curves = _next_binary_curves if frame_format == 'binary' else _next_csv_curves
+                
+                # Process every complete frame now in the buffer
+                while True:
+                    curves = next_curves()
+                    if curves is False:
+                        break
+                    if curves is not None:
+                        _process_curves(curves)
                         
-        except serial.SerialException as e:
-            print(f"Serial read error: {e}")
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            time.sleep(0.1)
+            except serial.SerialException as e:
+                print(f"Serial read error: {e}")
+                time.sleep(0.1)
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+                time.sleep(0.1)
+    finally:
+        selector.close()
 
 def get_latest():
-    """Get the most recent discharge curve"""
-    return latest_curve
+    """
+    Get the most recent discharge curve, or None if nothing received yet
+    
+    'values' and 'times_us' are numpy arrays viewing the shared buffers (no copy) -
+    use them straight away and do not modify them; the values row is overwritten
+    once the ring buffer wraps around.
+    """
+    if _count == 0:
+        return None
+    
+    last = (_idx - 1) % TIME_BUFFER_SIZE
+    return {
+        'timestamp': _ts[last],
+        'values': _ring[last],
+        'times_us': _TIMES_US
+    }
 
 def get_buffer():
-    """Get all buffered data"""
-    return list(data_buffer)
+    """Get all buffered curves as a 2D numpy array (one row per curve, oldest first)"""
+    if _count < TIME_BUFFER_SIZE:
+        return _ring[:_count].copy()
+    return np.roll(_ring, -_idx, axis=0)
 
 def get_average():
     """Get the running average of all buffered curves"""
+    averages = curve_averages.get_average()
     return {
-        'values': long_average_curve.get_average(),
-        'signal': fast_average_curve.get_average(),
-        'times_us': [i * sample_interval_us for i in range(CURVE_SAMPLE_SIZE)]
+        'values': averages[LONG_AVERAGE],
+        'signal': averages[FAST_AVERAGE],
+        'times_us': _TIMES_US
     }
 
 def clear_buffer():
     """Clear the data buffer"""
-    global latest_curve, running_sum, long_average_curve, fast_average_curve
-    data_buffer.clear()
-    latest_curve = None
+    global _idx, _count, running_sum, curve_averages
+    _idx = 0
+    _count = 0
     running_sum.fill(0)
-    long_average_curve.reset()
-    fast_average_curve.reset()  # Also reset fast average
+    curve_averages.reset()  # Resets both long and fast average
 
 def list_serial_ports():
     """List available serial ports"""
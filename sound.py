@@ -13,7 +13,11 @@ current_frequency = 440  # Hz
 current_volume = 0.3  # 0.0 to 1.0
 is_playing = False
 stream = None
-phase = 0.0  # To maintain phase continuity (in radians)
+phase = 0.0  # To maintain phase continuity (fractional wavetable index)
+
+# One cycle of a sine wave - tones are generated by indexing this instead of calling np.sin
+WAVETABLE_LEN = 4096
+_WAVETABLE = np.sin(2 * np.pi * np.arange(WAVETABLE_LEN) / WAVETABLE_LEN).astype(np.float32)
 
 def init():
     """Initialize the audio system"""
@@ -43,9 +47,13 @@ def beep(frequency=440, duration=1.0, volume=0.3):
         duration: Duration in seconds (default 1.0)
         volume: Volume from 0.0 to 1.0 (default 0.3)
     """
-    # Generate sine wave
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-    sine_wave = volume * np.sin(2 * np.pi * frequency * t)
+    # Generate sine wave from the wavetable (phase accumulator in table steps)
+    phase_inc = frequency * WAVETABLE_LEN / sample_rate
+    indices = np.arange(int(sample_rate * duration), dtype=np.float64)
+    indices *= phase_inc
+    np.mod(indices, WAVETABLE_LEN, out=indices)
+    sine_wave = _WAVETABLE[indices.astype(np.intp)]
+    sine_wave *= volume
     
     # Play and wait for completion
     sd.play(sine_wave, sample_rate)
@@ -74,30 +82,43 @@ def start_tone():
     is_playing = True
     phase = 0.0  # Use float for precise phase tracking
     
+    # Buffers owned by the stream, reused by every callback (no per-block allocation)
+    blocksize = 512
+    ramp = np.arange(blocksize, dtype=np.float64)  # 0, 1, 2, ... sample offsets within a block
+    index_buf = np.empty(blocksize)
+    int_index_buf = np.empty(blocksize, dtype=np.intp)
+    
     def callback(outdata, frames, time_info, status):
         global phase, current_frequency, current_volume
         
         if status:
             print(status)
         
-        # Generate time array
-        t = np.arange(frames) / sample_rate
+        # Wavetable steps per output sample at the current frequency
+        step = current_frequency * WAVETABLE_LEN / sample_rate
         
-        # Generate sine wave with current frequency
-        # Phase is in radians and accumulates across all frames
-        sine = current_volume * np.sin(2 * np.pi * current_frequency * t + phase)
+        # Look up the sine wave from the wavetable, written straight into the output buffer
+        # Phase is a wavetable index and accumulates across all frames
+        indices = index_buf[:frames]
+        int_indices = int_index_buf[:frames]
+        np.multiply(ramp[:frames], step, out=indices)
+        indices += phase
+        np.mod(indices, WAVETABLE_LEN, out=indices)
+        np.copyto(int_indices, indices, casting='unsafe')  # Truncate to table index
         
-        outdata[:, 0] = sine
+        out = outdata[:, 0]
+        np.take(_WAVETABLE, int_indices, out=out, mode='clip')
+        out *= current_volume
         
         # Update phase for next callback, keeping it wrapped to avoid overflow
         # This maintains phase continuity even when frequency changes
-        phase = (phase + 2 * np.pi * current_frequency * frames / sample_rate) % (2 * np.pi)
+        phase = (phase + step * frames) % WAVETABLE_LEN
     
     stream = sd.OutputStream(
         samplerate=sample_rate,
         channels=1,
         callback=callback,
-        blocksize=512
+        blocksize=blocksize
     )
     stream.start()
     print("Tone started")
@@ -127,6 +148,15 @@ def cleanup():
     print("Audio cleanup complete")
 
 
+# Soundscape mapping constants
+SOUND_DEBUG = False  # Print every soundscape update (slow - for debugging only)
+_INV_MAX_STRENGTH = 1.0 / 100  # 1 / max expected signal strength (lowered for more sensitivity)
+_MIN_VOLUME = 0.05  # Minimum volume instead of 0
+_VOL_SPAN = 0.7 - _MIN_VOLUME  # Maximum volume 0.7
+_MIN_FREQ = 400  # Frequency at zero signal
+_FREQ_SPAN = 1000 - _MIN_FREQ  # Frequency 1000 Hz at max signal
+
+
 def soundscape(signal_strength, signal_shape_ratio):
     """
     Update audio based on metal detector signal
@@ -141,24 +171,13 @@ def soundscape(signal_strength, signal_shape_ratio):
     """
     global current_frequency, current_volume
     
-   
-        
-    # Map signal strength to volume (0.05 to 0.7 for better sensitivity)
-    max_expected_strength = 100  # Lowered for more sensitivity
-    min_volume = 0.05   # Minimum volume instead of 0
-    max_volume = 0.7    # Maximum volume instead of 0.5
-
-    strength_ratio = min(1.0, signal_strength / max_expected_strength)
-    current_volume = min_volume + (max_volume - min_volume) * strength_ratio
-    
-    # Map signal strength to frequency
-    min_freq = 400   # Frequency at zero signal
-    max_freq = 1000  # Frequency at max signal
-    
-    strength_ratio = min(1.0, signal_strength / max_expected_strength)
-    current_frequency = min_freq + (max_freq - min_freq) * strength_ratio
+    # Map signal strength to volume and frequency (same ratio for both)
+    strength_ratio = min(1.0, signal_strength * _INV_MAX_STRENGTH)
+    current_volume = _MIN_VOLUME + _VOL_SPAN * strength_ratio
+    current_frequency = _MIN_FREQ + _FREQ_SPAN * strength_ratio
     
-    #print(f"Strength: {signal_strength:.0f}, Freq: {current_frequency:.0f} Hz, Vol: {current_volume:.3f}")
+    if SOUND_DEBUG:
+        print(f"Strength: {signal_strength:.0f}, Freq: {current_frequency:.0f} Hz, Vol: {current_volume:.3f}")
     
     # Ensure tone is playing
     if not is_playing:
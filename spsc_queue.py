@@ -0,0 +1,59 @@
+"""
+Single-consumer queue for the voice and WAV worker threads.
+deque append/popleft are atomic, so items move without taking a lock;
+the Event (which does lock internally) is only touched when the consumer
+has found the queue empty and is about to sleep.
+"""
+
+import threading
+import time
+import queue
+from collections import deque
+
+
+class SPSCQueue:
+    """Queue with one consumer thread (puts from any thread are safe)."""
+
+    def __init__(self):
+        self._items = deque()
+        self._ready = threading.Event()
+        self._waiting = False  # Consumer is (about to be) asleep on _ready
+
+    def put(self, item):
+        """Add an item, waking the consumer only if it is waiting."""
+        self._items.append(item)
+        if self._waiting:
+            self._ready.set()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, waiting up to timeout seconds in total (None = forever).
+
+        Raises:
+            queue.Empty: if no item arrived within timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                pass
+
+            self._waiting = True
+            try:
+                # Re-check after announcing the wait - a put() that missed the flag left its item here
+                if self._items:
+                    continue
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+
+                # A stale set() from an earlier put only costs one extra pass round the loop
+                self._ready.wait(remaining)
+                self._ready.clear()
+            finally:
+                self._waiting = False
+
+    def empty(self):
+        """True if no items are waiting."""
+        return not self._items
@@ -2,14 +2,77 @@
 """
 Voice module for WOMBAT PiPi metal detector.
 Uses espeak-ng directly for reliable female voice.
+Speaks through libespeak-ng in-process when the library is available,
+otherwise runs the espeak-ng command for each phrase.
 """
 
+import asyncio
+import collections
+import ctypes
+import functools
+import hashlib
+import logging
+import os
 import subprocess
+import tempfile
 import threading
-import queue
+from spsc_queue import SPSCQueue
 import time
 import sys
 
+log = logging.getLogger(__name__)  # Speech messages are debug level - silent unless enabled
+
+# libespeak-ng (loaded with ctypes) and the constants we use from speak_lib.h
+ESPEAK_LIB = 'libespeak-ng.so.1'
+_AUDIO_OUTPUT_PLAYBACK = 0
+_espeakCHARS_UTF8 = 1
+_espeakRATE = 1
+_espeakVOLUME = 2
+_espeakPITCH = 3
+_espeakWORDGAP = 7
+_EE_OK = 0
+_espeakINITIALIZE_DONT_EXIT = 0x8000  # Return an error instead of exit() when initialization fails
+_WORD_GAP = 8  # Pause between words (units of 10ms), same as espeak-ng -g 8
+
+# Synthesized phrases (espeak-ng command path) are cached in RAM and on disk
+# (per-user cache directory, private to its owner)
+TTS_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'wombat_tts')
+TTS_CACHE_SIZE = 128  # Phrases kept in RAM
+
+# say() drops text that is already queued or was spoken less than this many seconds ago
+REPEAT_WINDOW_S = 0.75
+
+@functools.lru_cache(maxsize=None)
+def _load_library():
+    """
+    Load and initialize libespeak-ng, once per process (every VoiceEngine shares it).
+    
+    Returns:
+        The ctypes library, or None if it is not available
+    """
+    try:
+        lib = ctypes.CDLL(ESPEAK_LIB)
+    except OSError as e:
+        log.warning("%s not available (%s), using espeak-ng command", ESPEAK_LIB, e)
+        return None
+    
+    lib.espeak_Initialize.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+    lib.espeak_Initialize.restype = ctypes.c_int
+    lib.espeak_SetVoiceByName.argtypes = [ctypes.c_char_p]
+    lib.espeak_SetVoiceByName.restype = ctypes.c_int
+    lib.espeak_SetParameter.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int]
+    lib.espeak_SetParameter.restype = ctypes.c_int
+    lib.espeak_Synth.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_uint, ctypes.c_int,
+                                 ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p]
+    lib.espeak_Synth.restype = ctypes.c_int
+    lib.espeak_Synchronize.restype = ctypes.c_int
+    
+    if lib.espeak_Initialize(_AUDIO_OUTPUT_PLAYBACK, 0, None, _espeakINITIALIZE_DONT_EXIT) < 0:
+        log.warning("libespeak-ng failed to initialize, using espeak-ng command")
+        return None
+    return lib
+
+
 class VoiceEngine:
     """Thread-safe voice engine using espeak-ng directly."""
     
@@ -26,65 +89,226 @@ class VoiceEngine:
         self.pitch = pitch
         self.voice = voice
         self.volume = volume
-        self.queue = queue.Queue()
+        self.queue = SPSCQueue()
         self.running = False
         self.worker_thread = None
         
+        # In-process speech engine (None = fall back to the espeak-ng command)
+        self._lib = _load_library()
+        self._lib_settings_dirty = True  # Voice settings must be (re)applied before the next phrase
+        
+        # (text, voice, pitch, rate, volume) -> WAV bytes, least recently used first
+        self._cache = collections.OrderedDict()
+        
+        # Duplicate suppression for bursty triggers
+        self._pending = set()  # Texts waiting in the queue
+        self._recent = {}  # text -> time.monotonic() when it was last spoken
+        
+        # Guards _cache, _pending and _recent - used by the worker, callers of say() and the event loop
+        self._state_lock = threading.Lock()
+    
+    def _apply_lib_settings(self):
+        """Push the current voice settings into libespeak-ng (worker thread only)."""
+        self._lib.espeak_SetVoiceByName(self.voice.encode('utf-8'))
+        self._lib.espeak_SetParameter(_espeakRATE, self.rate, 0)
+        self._lib.espeak_SetParameter(_espeakPITCH, self.pitch, 0)
+        self._lib.espeak_SetParameter(_espeakVOLUME, self.volume, 0)
+        self._lib.espeak_SetParameter(_espeakWORDGAP, _WORD_GAP, 0)
+        self._lib_settings_dirty = False
+    
     def _speak_direct(self, text):
-        """Call espeak-ng directly with female voice settings."""
+        """Speak text with female voice settings (blocks until speech completes)."""
+        if self._lib is not None:
+            return self._speak_library(text)
+        return self._speak_command(text)
+    
+    def _speak_library(self, text):
+        """Speak through the in-process libespeak-ng."""
         try:
-            cmd = [
-                'espeak-ng',
-                '-v', self.voice,      # Voice variant
-                '-p', str(self.pitch), # Pitch (50-99, higher = more feminine)
-                '-s', str(self.rate),  # Speed in words per minute
-                '-a', str(self.volume),# Amplitude/volume (0-200)
-                '-g', '8',             # Word gap (pause between words)
-                text
-            ]
+            if self._lib_settings_dirty:
+                self._apply_lib_settings()
             
-            # Run espeak-ng (blocks until speech completes)
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            data = text.encode('utf-8')
+            result = self._lib.espeak_Synth(data, len(data) + 1, 0, 0, 0, _espeakCHARS_UTF8, None, None)
+            if result != _EE_OK:
+                log.error("espeak_Synth failed (error %s)", result)
+                return False
+            self._lib.espeak_Synchronize()  # Wait for playback to finish
+            return True
+            
+        except Exception as e:
+            log.error("Unexpected error: %s", e)
+            return False
+    
+    def _synth_command(self, text):
+        """espeak-ng command that writes the WAV for text to stdout."""
+        return [
+            'espeak-ng',
+            '-v', self.voice,      # Voice variant
+            '-p', str(self.pitch), # Pitch (50-99, higher = more feminine)
+            '-s', str(self.rate),  # Speed in words per minute
+            '-a', str(self.volume),# Amplitude/volume (0-200)
+            '-g', '8',             # Word gap (pause between words)
+            '--stdout',            # Write WAV to stdout instead of playing it
+            text
+        ]
+    
+    def _store_wav(self, key, wav):
+        """Add a synthesized WAV to the RAM cache, dropping the least recently used."""
+        with self._state_lock:
+            self._cache[key] = wav
+            if len(self._cache) > TTS_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    def _lookup_wav(self, key):
+        """Get a WAV from the RAM cache (marking it most recently used), or None."""
+        with self._state_lock:
+            wav = self._cache.get(key)
+            if wav is not None:
+                self._cache.move_to_end(key)
+            return wav
+    
+    def _cached_wav(self, text):
+        """Get the WAV for text at the current settings - from RAM, then disk, else synthesize it."""
+        key = (text, self.voice, self.pitch, self.rate, self.volume)
+        
+        wav = self._lookup_wav(key)
+        if wav is not None:
+            return wav
+        
+        path = os.path.join(TTS_CACHE_DIR, hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest() + '.wav')
+        wav = self._read_cache_file(path)
+        if wav is None:
+            wav = subprocess.run(self._synth_command(text), check=True,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+            self._write_cache_file(path, wav)
+        
+        self._store_wav(key, wav)
+        return wav
+    
+    def _read_cache_file(self, path):
+        """Read a cached WAV file, or None if it is missing or not a WAV."""
+        try:
+            with open(path, 'rb') as f:
+                wav = f.read()
+        except OSError:
+            return None
+        return wav if wav.startswith(b'RIFF') else None
+    
+    def _write_cache_file(self, path, wav):
+        """Write a WAV into the cache directory atomically (temp file, then rename into place)."""
+        tmp_path = None
+        try:
+            os.makedirs(TTS_CACHE_DIR, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=TTS_CACHE_DIR, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(wav)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning("Could not write TTS cache file: %s", e)
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+    
+    async def speak_async(self, text):
+        """Speak text from asyncio code without blocking the event loop (returns when speech completes).
+        
+        Uses espeak-ng/aplay subprocesses (sharing the phrase cache), never the
+        libespeak-ng instance, which belongs to the worker thread.
+        """
+        key = (text, self.voice, self.pitch, self.rate, self.volume)
+        try:
+            wav = self._lookup_wav(key)
+            if wav is None:
+                proc = await asyncio.create_subprocess_exec(*self._synth_command(text),
+                                                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                wav, _ = await proc.communicate()
+                if proc.returncode != 0:
+                    log.error("espeak-ng error: exit status %s", proc.returncode)
+                    return False
+                self._store_wav(key, wav)
+            
+            proc = await asyncio.create_subprocess_exec('aplay', '-q', '-D', 'default', '-', stdin=subprocess.PIPE,
+                                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            await proc.communicate(wav)
+            self._mark_spoken(text)
+            return proc.returncode == 0
+            
+        except FileNotFoundError as e:
+            log.error("%s not found. Install with: sudo apt install espeak-ng alsa-utils", e.filename)
+            return False
+        except Exception as e:
+            log.error("Unexpected error: %s", e)
+            return False
+    
+    def _speak_command(self, text):
+        """Call espeak-ng directly with female voice settings (synthesized audio is cached)."""
+        try:
+            wav = self._cached_wav(text)
+            
+            # Play the WAV (blocks until speech completes)
+            subprocess.run(['aplay', '-q', '-D', 'default', '-'], input=wav, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             return True
             
         except subprocess.CalledProcessError as e:
-            print(f"[Voice] espeak-ng error: {e}")
+            log.error("%s error: %s", e.cmd[0], e)
             return False
-        except FileNotFoundError:
-            print("[Voice] espeak-ng not found. Install with: sudo apt install espeak-ng")
+        except FileNotFoundError as e:
+            log.error("%s not found. Install with: sudo apt install espeak-ng alsa-utils", e.filename)
             return False
         except Exception as e:
-            print(f"[Voice] Unexpected error: {e}")
+            log.error("Unexpected error: %s", e)
             return False
     
     def _worker(self):
         """Background worker that processes speech queue."""
         while self.running:
             try:
-                # Get text from queue with timeout
-                text = self.queue.get(timeout=0.5)
+                # Sleep until text (or the shutdown signal) arrives
+                text = self.queue.get()
                 
                 if text is None:  # Shutdown signal
                     break
+                
+                log.debug("Speaking: %s", text)
+                try:
+                    self._speak_direct(text)
+                finally:
+                    # Still pending while speaking, so repeats during speech are dropped too
+                    self._mark_spoken(text, pending=True)
                     
-                print(f"[Voice] Speaking: {text}")
-                self._speak_direct(text)
-                    
-                self.queue.task_done()
                 
-            except queue.Empty:
-                continue  # No messages, keep waiting
             except Exception as e:
-                print(f"[Voice] Error in worker: {e}")
+                log.error("Error in worker: %s", e)
                 time.sleep(0.1)
     
+    def _mark_spoken(self, text, pending=False):
+        """
+        Record when text was spoken, pruning entries that are past the repeat window.
+        
+        Args:
+            text: String that was spoken
+            pending: True if text came from the queue (it stops being pending now)
+        """
+        now = time.monotonic()
+        with self._state_lock:
+            self._recent[text] = now
+            if pending:
+                self._pending.discard(text)
+            
+            if len(self._recent) > 32:
+                self._recent = {t: when for t, when in self._recent.items() if now - when < REPEAT_WINDOW_S}
+    
     def start(self):
         """Start the voice engine worker thread."""
         if not self.running:
             self.running = True
             self.worker_thread = threading.Thread(target=self._worker, daemon=True)
             self.worker_thread.start()
-            print(f"[Voice] Engine started (voice: {self.voice}, pitch: {self.pitch})")
+            log.info("Engine started (voice: %s, pitch: %s)", self.voice, self.pitch)
     
     def stop(self):
         """Stop the voice engine."""
@@ -93,19 +317,27 @@ class VoiceEngine:
             self.queue.put(None)  # Signal shutdown
             if self.worker_thread:
                 self.worker_thread.join(timeout=2.0)
-            print("[Voice] Engine stopped")
+            log.info("Engine stopped")
     
     def say(self, text):
         """Queue text for speaking (non-blocking).
         
+        Text that is already queued, or was spoken within REPEAT_WINDOW_S,
+        is not queued again.
+        
         Args:
             text: String to speak
         """
         if self.running and text:
+            # Already queued or just spoken - the repeat would add nothing
+            with self._state_lock:
+                if text in self._pending or time.monotonic() - self._recent.get(text, float('-inf')) < REPEAT_WINDOW_S:
+                    return True
+                self._pending.add(text)
             self.queue.put(text)
             return True
         else:
-            print(f"[Voice] Not running, cannot speak: {text}")
+            log.warning("Not running, cannot speak: %s", text)
             return False
     
     def update_voice(self, voice=None, pitch=None, rate=None, volume=None):
@@ -114,7 +346,8 @@ class VoiceEngine:
         if pitch: self.pitch = pitch
         if rate: self.rate = rate
         if volume: self.volume = volume
-        print(f"[Voice] Updated settings: voice={self.voice}, pitch={self.pitch}, rate={self.rate}")
+        self._lib_settings_dirty = True  # Applied by the worker before the next phrase
+        log.info("Updated settings: voice=%s, pitch=%s, rate=%s", self.voice, self.pitch, self.rate)
 
 # Global instance for easy import
 _voice_engine = None
@@ -146,6 +379,18 @@ def say(text):
         init()
     return _voice_engine.say(text)
 
+async def say_async(text):
+    """Speak text from asyncio code (awaits until speech completes, without blocking the loop).
+    
+    Args:
+        text: String to speak
+    """
+    global _voice_engine
+    if _voice_engine is None:
+        # Auto-initialize with female voice defaults
+        init()
+    return await _voice_engine.speak_async(text)
+
 def update_settings(voice=None, pitch=None, rate=None, volume=None):
     """Update voice settings."""
     global _voice_engine
@@ -176,6 +421,7 @@ def test_voice_variants():
 
 def main():
     """Standalone test function."""
+    logging.basicConfig(level=logging.DEBUG, format="[%(name)s] %(message)s")  # Show what is spoken
     print("=== Voice Module Test (espeak-ng direct) ===")
     print("Press Ctrl+C to exit\n")
     
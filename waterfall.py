@@ -36,10 +36,9 @@ def update_waterfall(n):
     avg = serial_reader.get_average()
     
     if latest and avg and latest['values'] is not None:
-        # Calculate deviation from running average (normalize)
-        latest_values = np.array(latest['values'])
-        avg_values = np.array(avg['values'])
-        normalized = latest_values - avg_values
+        # Calculate deviation from running average (normalize) - both are already ndarrays
+        # (a fresh array per request - Dash may run this callback on several threads at once)
+        normalized = np.subtract(latest['values'], avg['values'])
         
         fig = go.Figure()
         
@@ -5,12 +5,28 @@ Plays WAV files in sequence with precise timing.
 """
 
 import pygame
+import numpy as np
 import threading
-import queue
+import asyncio
+import logging
+from spsc_queue import SPSCQueue
 import os
 import subprocess
+import time
+import wave
 
 
+log = logging.getLogger(__name__)
+
+# Mixer format - matches the digit WAVs (16kHz mono) so pygame does not resample
+MIXER_FREQUENCY = 16000
+MIXER_BUFFER = 512
+
+RESTART_WAIT_S = 0.1  # Longest start() waits for a stopped worker to exit
+
+# Raw PCM format of the digit WAVs, for the aplay fallback pipe
+APLAY_COMMAND = ["aplay", "-q", "-D", "default", "-t", "raw", "-f", "U8", "-r", str(MIXER_FREQUENCY), "-c", "1"]
+
 IS_PLAYING = False
 
 def is_playing():
@@ -22,30 +38,96 @@ class WavPlayer:
     
     def __init__(self, wav_path="wavs"):
         self.wav_path = wav_path
-        self.queue = queue.Queue()
+        self._paths = [os.path.join(wav_path, f"{digit}.wav") for digit in "0123456789"]  # Indexed by digit value
+        self.queue = SPSCQueue()
         self.running = False
         self.worker_thread = None
+        self.sounds = {}
+        self.numbers = {}
+        self.channel = None
+        self.raw = [b""] * 10  # PCM per digit value, for the aplay pipe
+        self._aplay = None
+        self._aplay_lock = threading.Lock()
+        
+        # Decode all digits once and keep the mixer open - falls back to aplay if there is no mixer
+        try:
+            pygame.mixer.pre_init(MIXER_FREQUENCY, -16, 1, MIXER_BUFFER)
+            pygame.mixer.init()
+            pygame.mixer.set_reserved(1)
+            self.channel = pygame.mixer.Channel(0)  # Reserved for number playback
+            self._load_sounds()
+        except pygame.error as e:
+            log.warning("Mixer unavailable (%s), using aplay", e)
+            self.channel = None
         
-       
+        # No prebuilt numbers (no mixer, or a digit failed to load) - play the digits that did load through aplay
+        if not self.numbers:
+            self._load_raw()
     
     def _load_sounds(self):
         """Load all WAV files (0-9) into memory."""
-        for i in range(10):
-            filepath = os.path.join(self.wav_path, f"{i}.wav")
+        for i, filepath in enumerate(self._paths):
             if os.path.exists(filepath):
                 try:
                     self.sounds[str(i)] = pygame.mixer.Sound(filepath)
                 except Exception as e:
-                    print(f"[WAV] Failed to load {filepath}: {e}")
+                    log.error("Failed to load %s: %s", filepath, e)
             else:
-                print(f"[WAV] Warning: Missing {filepath}")
+                log.warning("Missing %s", filepath)
+        
+        if len(self.sounds) == 10:
+            self._build_numbers()
+    
+    def _load_raw(self):
+        """Load the PCM frames of each digit WAV (header stripped) for the aplay pipe."""
+        for i, filepath in enumerate(self._paths):
+            try:
+                with wave.open(filepath, "rb") as wav:
+                    self.raw[i] = wav.readframes(wav.getnframes())
+            except (OSError, wave.Error) as e:
+                log.error("Failed to load %s: %s", filepath, e)
+    
+    def _play_raw(self, number_str):
+        """
+        Write a number's PCM to the long-running aplay process (started on first use).
+        
+        Returns:
+            Playback duration in seconds
+        """
+        raw = self.raw
+        pcm = raw[ord(number_str[0]) - 48] + raw[ord(number_str[1]) - 48]  # '0' is 48
+        with self._aplay_lock:
+            if self._aplay is None or self._aplay.poll() is not None:
+                self._aplay = subprocess.Popen(APLAY_COMMAND, stdin=subprocess.PIPE)
+            self._aplay.stdin.write(pcm)
+            self._aplay.stdin.flush()
+        return len(pcm) / MIXER_FREQUENCY
+    
+    def _close_aplay(self):
+        """End the aplay process, letting it finish what it was sent."""
+        with self._aplay_lock:
+            if self._aplay is not None:
+                try:
+                    self._aplay.stdin.close()
+                    self._aplay.wait(timeout=2.0)
+                except (OSError, subprocess.TimeoutExpired):
+                    self._aplay.kill()
+                self._aplay = None
+    
+    def _build_numbers(self):
+        """Join digit pairs into one Sound per number '00'-'99' (played as a single clip)."""
+        samples = {digit: pygame.sndarray.array(sound) for digit, sound in self.sounds.items()}
+        for i in range(100):
+            number_str = f"{i:02d}"
+            joined = np.concatenate([samples[number_str[0]], samples[number_str[1]]])
+            self.numbers[number_str] = pygame.sndarray.make_sound(joined)
     
     def _wait_for_channel(self, channel):
         """Wait efficiently for a channel to finish playing."""
         if channel:
             # Busy-wait with tiny sleeps (more efficient than pygame.time.wait)
             while channel.get_busy():
-                pygame.time.wait(10)  # 10ms checks
+                pygame.time.wait(5)  # 5ms checks
     
    
 
@@ -53,47 +135,84 @@ class WavPlayer:
         global IS_PLAYING        
     
         IS_PLAYING = True
-    
-        # Play each digit using aplay (blocks)
-        for digit in number_str:
-            wav_file = f"{self.wav_path}/{digit}.wav"
-            subprocess.run([
-                "aplay", "-q",
-                "-D", "default",  # Use dmix device
-                wav_file
-            ])
+        
+        if self.channel is not None and number_str in self.numbers:
+            # Play the prebuilt number on the reserved channel (blocks)
+            self.channel.play(self.numbers[number_str])
+            self._wait_for_channel(self.channel)
+        else:
+            # Feed both digits to the running aplay and wait out the playback time (blocks)
+            time.sleep(self._play_raw(number_str))
     
         IS_PLAYING = False
         # Tone continues automatically via dmix
-  
     
-    def _worker(self):
-        """Background worker that processes number queue."""
-        while self.running:
+    async def _say_number_async(self, number_str):
+        """Play a number from asyncio code without blocking the event loop."""
+        global IS_PLAYING
+        
+        IS_PLAYING = True
+        try:
+            if self.channel is not None and number_str in self.numbers:
+                # Any free channel - the reserved one belongs to the worker thread
+                channel = self.numbers[number_str].play()
+                while channel is not None and channel.get_busy():
+                    await asyncio.sleep(0.005)
+            else:
+                # The pipe write can block (lock held by the worker, full pipe) - keep it off the event loop
+                loop = asyncio.get_running_loop()
+                await asyncio.sleep(await loop.run_in_executor(None, self._play_raw, number_str))
+        finally:
+            IS_PLAYING = False
+    
+    def _worker(self, queue):
+        """Background worker that processes number queue (the queue of the start() that launched it)."""
+        while True:
             try:
-                number_str = self.queue.get(timeout=0.5)
-                if number_str is None:
+                number_str = queue.get()  # Sleeps until a number (or the shutdown signal) arrives
+                if number_str is None or not self.running:
                     break
                 self._say_number(number_str)
-                self.queue.task_done()
-            except queue.Empty:
-                continue
             except Exception as e:
-                print(f"[WAV] Error: {e}")
+                log.error("Error: %s", e)
     
     def start(self):
+        """
+        Start the worker thread (no-op if running).
+        
+        Returns:
+            False if the previous worker is still finishing its number - try again later
+        """
         if not self.running:
+            # The previous worker must be gone before a new one takes over the channel,
+            # but never hold up the caller (the serial reader thread) for long
+            if self.worker_thread is not None:
+                self.worker_thread.join(timeout=RESTART_WAIT_S)
+                if self.worker_thread.is_alive():
+                    log.warning("Previous worker still playing, not restarting yet")
+                    return False
+            self.queue = SPSCQueue()  # Fresh queue - numbers left over from before stop() are dropped
             self.running = True
-            self.worker_thread = threading.Thread(target=self._worker, daemon=True)
+            self.worker_thread = threading.Thread(target=self._worker, args=(self.queue,), daemon=True)
             self.worker_thread.start()
+        return True
     
     def stop(self):
+        """
+        Stop the worker thread, dropping queued numbers (one already playing finishes).
+        The mixer (and aplay pipe) stay open so start() can resume instantly.
+        """
         if self.running:
             self.running = False
-            self.queue.put(None)
+            self.queue.put(None)  # Wakes the worker if it is waiting
             if self.worker_thread:
                 self.worker_thread.join(timeout=2.0)
-            pygame.mixer.quit()
+    
+    def shutdown(self):
+        """Stop the worker and release the audio device (mixer and aplay pipe)."""
+        self.stop()
+        self._close_aplay()
+        pygame.mixer.quit()
     
     def say_number(self, number):
         """Queue a number (00-99) to play."""
@@ -114,19 +233,38 @@ def init(wav_path="wavs"):
     global _player
     if _player is None:
         _player = WavPlayer(wav_path)
-        _player.start()
+    _player.start()  # Also resumes a player paused by stop()
     return _player
 
 def say(number):
     global _player
-    if _player is None:
+    if _player is None or not _player.running:
         init()
     return _player.say_number(number)
 
-def stop():
+async def say_async(number):
+    """Play a number (00-99) from asyncio code, returning when playback completes."""
     global _player
+    if _player is None:
+        init()
+    
+    num_str = str(number).zfill(2)
+    if len(num_str) != 2 or not num_str.isdigit():
+        return False
+    
+    await _player._say_number_async(num_str)
+    return True
+
+def stop():
+    """Stop playback of queued numbers, keeping the audio device open for the next init()."""
     if _player:
         _player.stop()
+
+def shutdown():
+    """Stop playback and close the audio device (at program exit)."""
+    global _player
+    if _player:
+        _player.shutdown()
         _player = None
 
 def test_blocking():
@@ -144,4 +282,4 @@ if __name__ == "__main__":
     test_blocking()
     import time
     time.sleep(5)  # Wait for playback
-    stop()
+    shutdown()
@@ -4,13 +4,16 @@
 
 import asyncio
 import websockets
-import json
+import orjson
 import numpy as np
 import serial_reader
 import settings
 import functions
 import sound
-import copy
+
+SEND_INTERVAL_S = 0.1  # Max stream rate to each client (10Hz)
+BATCH_MAX = 10  # Frames held for a slow client before sending anyway (1s at 10Hz)
+QUANT_MAX = 32767  # Plot values go out as int16 counts of 'scale'
 
 # Initialize
 sound.init()
@@ -19,77 +22,216 @@ sound.init()
 serial_reader.init()
 serial_reader.start_reading()
 
+def _encode(message):
+    """
+    Serialize a message to JSON with orjson (numpy arrays and scalars are encoded natively)
+    
+    Returned as str so it goes out as a text frame - the pages JSON.parse(event.data)
+    """
+    return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+
+# Fixed parts of the 'data' frame - only the values are encoded per frame
+_DATA_HEAD = b'{"type":"data","times":'
+_DATA_VALUES = b',"values":'
+_DATA_SCALE = b',"scale":'
+_DATA_TIMESTAMP = b',"timestamp":'
+_FEATURE_KEYS = (b',"features":{"total_sum":', b',"first_half_sum":', b',"second_half_sum":',
+                 b',"diff":', b',"cumulative_total":', b',"ratio":')
+_DATA_TAIL = b'}}'
+
+# Sample times never change - encoded once and reused while the same array comes back
+_times_source = None
+_times_json = b'[]'
+
+def _encode_data(times, values, scale, timestamp, features):
+    """
+    Build a 'data' frame from the precompiled template, same JSON as _encode() of the dict
+    
+    Args:
+        times: sample times array (shared, unchanging)
+        values: int16 numpy array of quantized values
+        scale: value scale factor
+        timestamp: curve timestamp
+        features: (total_sum, first_half_sum, second_half_sum, diff, cumulative_total, ratio)
+    
+    Returns:
+        JSON str
+    """
+    global _times_source, _times_json
+    if times is not _times_source:
+        _times_json = orjson.dumps(times, option=orjson.OPT_SERIALIZE_NUMPY)
+        _times_source = times
+    
+    parts = [_DATA_HEAD, _times_json,
+             _DATA_VALUES, orjson.dumps(values, option=orjson.OPT_SERIALIZE_NUMPY),
+             _DATA_SCALE, orjson.dumps(scale),
+             _DATA_TIMESTAMP, orjson.dumps(timestamp, option=orjson.OPT_SERIALIZE_NUMPY)]
+    for key, value in zip(_FEATURE_KEYS, features):
+        parts.append(key)
+        parts.append(orjson.dumps(value))
+    parts.append(_DATA_TAIL)
+    return b''.join(parts).decode('utf-8')
+
+def _encode_batch(frames):
+    """Combine encoded 'data' frames into one 'batch' message (frames in arrival order)"""
+    return '{"type":"batch","frames":[' + ','.join(frames) + ']}'
+
+def _quantize(values):
+    """
+    Quantize a curve to int16 for sending - plenty of precision for plotting
+    
+    Args:
+        values: numpy array of floats (non-finite values are sent as 0)
+    
+    Returns:
+        (int16 numpy array, scale) - the client multiplies each value by scale
+    """
+    # NaN/inf (the parser accepts 'nan' off the wire) go out as 0 and do not affect the scale
+    values = np.where(np.isfinite(values), values, 0.0)
+    peak = float(np.abs(values).max())
+    scale = max(peak, 1e-6) / QUANT_MAX
+    return np.rint(values / scale).astype(np.int16), scale
+
+# Per-client queues of encoded frames, fed by the shared fanout task
+_client_queues = set()
+_fanout_task = None
+
+def _build_frame():
+    """Encode the current curve and features as a 'data' frame, or None if there is no data yet"""
+    latest = serial_reader.get_latest()
+    avg = serial_reader.get_average()
+    if not (latest and avg):
+        return None
+    
+    #normalized = np.array(avg['signal']) - np.array(avg['values'])
+    normalized, scale = _quantize(avg['signal'])
+    
+    # Read the features straight into locals (plain floats, no copy needed)
+    features = functions.current_features
+    total_sum = features.total_sum
+    first_half_sum = features.first_half_sum
+    second_half_sum = features.second_half_sum
+    diff = features.diff
+    cumulative_total = features.cumulative_total
+    ratio = features.ratio
+    
+    # Update soundscape based on signal
+    #sound.soundscape(features.total_sum, ratio)
+    
+    return _encode_data(
+        latest['times_us'], normalized, scale, latest['timestamp'],
+        (total_sum, first_half_sum, second_half_sum, diff, cumulative_total, ratio))
+
+async def _fanout():
+    """Encode each new frame once (at most 10Hz) and hand it to every connected client's queue"""
+    # Woken by the serial reader thread when a new curve is stored
+    loop = asyncio.get_running_loop()
+    new_frame = asyncio.Event()
+    
+    def on_new_frame():
+        # Only schedule a wakeup if one is not already pending
+        if not new_frame.is_set():
+            loop.call_soon_threadsafe(new_frame.set)
+    
+    serial_reader.add_frame_listener(on_new_frame)
+    try:
+        next_send = loop.time()
+        while True:
+            # Sleep until new data arrives (no wakeups while the device is quiet)
+            await new_frame.wait()
+            
+            # Keep to the 10Hz cap - curves arriving meanwhile are merged into this send
+            remaining = next_send - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            new_frame.clear()
+            next_send = loop.time() + SEND_INTERVAL_S
+            
+            if not _client_queues:
+                continue
+            
+            try:
+                frame = _build_frame()
+            except Exception as e:
+                print(f"Error building frame: {e}")
+                continue
+            if frame is None:
+                continue
+            
+            for queue in _client_queues:
+                # A client that stopped draining loses its oldest frame, not the newest
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(frame)
+    finally:
+        serial_reader.remove_frame_listener(on_new_frame)
+
 async def stream_data(websocket):
     """Stream data and handle incoming commands"""
+    global _fanout_task
     print(f"Client connected: {websocket.remote_address}")
     
+    # One shared producer for all clients, started with the first connection
+    if _fanout_task is None or _fanout_task.done():
+        _fanout_task = asyncio.create_task(_fanout())
+    
+    frames = asyncio.Queue(maxsize=BATCH_MAX)
+    _client_queues.add(frames)
+    
     try:
         # Send initial tau value
-        await websocket.send(json.dumps({
+        await websocket.send(_encode({
             'type': 'settings',
             'tau': settings.settings.tau
         }))
         
         async def send_data():
             while True:
-                latest = serial_reader.get_latest()
-                avg = serial_reader.get_average()
+                pending = [await frames.get()]
                 
-                if latest and avg:
-                    #normalized = np.array(avg['signal']) - np.array(avg['values'])
-                    normalized = np.array(avg['signal'])
-                    
-                    # Extract signal features for soundscape
-                    features = copy.copy(functions.current_features)  # Shallow copy
-                    
-                                        
-                    # Calculate shape ratio
-                    #if features['second_half_sum'] > 0:
-                        #ratio = features['first_half_sum'] / features['second_half_sum']
-                    #else:
-                        #ratio = 1.0
-                    ratio = features['ratio']
-                    
-                    # Update soundscape based on signal
-                    #sound.soundscape(features['total_sum'], ratio)
-                    
-                    data = {
-                        'type': 'data',
-                        'times': latest['times_us'],
-                        'values': normalized.tolist(),
-                        'timestamp': latest['timestamp'],
-                        'features': {
-                            'total_sum': features['total_sum'],
-                            'first_half_sum': features['first_half_sum'],
-                            'second_half_sum': features['second_half_sum'],
-                            'diff': features['diff'],
-                            'cumulative_total':features['cumulative_total'],
-                            'ratio': ratio
-                        }
-                    }
-                    
-                    await websocket.send(json.dumps(data))
+                # Client still has unsent data queued - collect frames and send them as one batch
+                while websocket.transport.get_write_buffer_size() > 0 and len(pending) < BATCH_MAX:
+                    try:
+                        pending.append(await asyncio.wait_for(frames.get(), SEND_INTERVAL_S))
+                    except asyncio.TimeoutError:
+                        pass
                 
-                await asyncio.sleep(0.1)
+                if len(pending) == 1:
+                    await websocket.send(pending[0])
+                else:
+                    await websocket.send(_encode_batch(pending))
         
         async def receive_commands():
             async for message in websocket:
                 try:
-                    cmd = json.loads(message)
+                    cmd = orjson.loads(message)
                     if cmd.get('type') == 'set_tau':
                         settings.settings.tau = cmd['tau']
                         print(f"TAU updated to: {settings.settings.tau} µs")
-                        await websocket.send(json.dumps({
+                        await websocket.send(_encode({
                             'type': 'settings',
                             'tau': settings.settings.tau
                         }))
                 except Exception as e:
                     print(f"Error processing command: {e}")
         
-        await asyncio.gather(send_data(), receive_commands())
+        # receive_commands ends when the client goes away - send_data may be waiting
+        # on a quiet device, so it is cancelled rather than awaited
+        send_task = asyncio.create_task(send_data())
+        receive_task = asyncio.create_task(receive_commands())
+        try:
+            done, _ = await asyncio.wait((send_task, receive_task), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # Raise anything other than a normal close
+        finally:
+            send_task.cancel()
+            receive_task.cancel()
         
     except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
         print(f"Client disconnected: {websocket.remote_address}")
+        _client_queues.discard(frames)
         # Stop sound when client disconnects
         sound.stop_tone()
         